@@ -6,58 +6,122 @@
 from __future__ import annotations
 
 import sqlite3
+import threading
 from pathlib import Path
-from typing import List, Sequence
+from typing import List, Optional, Sequence
 
 # Файл БД лежит в корне проекта, используем абсолютный путь для надежности
 DB_PATH = Path(__file__).resolve().parent.parent / "telegram_messages.db"
 
+# Одно соединение на процесс; доступ из разных потоков сериализуется через _lock
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+# Постоянные тексты запросов: sqlite3 кэширует подготовленные выражения по тексту SQL
+_SQL_FETCH_UNSUMMARIZED = """
+    SELECT id, chat_id, sender, sender_id, text, date
+    FROM messages
+    WHERE summarized = 0
+    ORDER BY date DESC
+    LIMIT ?
+"""
+_SQL_MARK_SUMMARIZED = "UPDATE messages SET summarized = 1 WHERE id = ?"
+
+# Версия схемы БД (PRAGMA user_version); увеличивать при изменении ensure_schema
+# вместе с SCHEMA_VERSION в teleton/db.py (оба модуля работают с одним файлом)
+SCHEMA_VERSION = 2
+_schema_ready = False
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Возвращает общее соединение с БД, открывая его при первом обращении."""
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(
+            DB_PATH,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-64000")
+        _conn = conn
+    return _conn
+
 
 def ensure_schema() -> None:
-    """Создает таблицу и недостающие колонки (summarized)."""
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY,
-                chat_id INTEGER NOT NULL,
-                sender TEXT,
-                sender_id INTEGER,
-                text TEXT,
-                date TIMESTAMP,
-                summarized INTEGER DEFAULT 0,
-                UNIQUE(id, chat_id)
+    """
+    Создает таблицу, недостающие колонки (summarized) и индексы,
+    переводит даты в миллисекунды Unix.
+    Выполняется один раз за процесс; версия схемы хранится в PRAGMA user_version.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _lock:
+        conn = _get_conn()
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            _schema_ready = True
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    chat_id INTEGER NOT NULL,
+                    sender TEXT,
+                    sender_id INTEGER,
+                    text TEXT,
+                    date INTEGER,
+                    summarized INTEGER DEFAULT 0,
+                    UNIQUE(id, chat_id)
+                )
+                """
             )
-            """
-        )
 
-        # Проверяем наличие колонки summarized
-        columns = {
-            row[1] for row in conn.execute("PRAGMA table_info(messages)").fetchall()
-        }
-        if "summarized" not in columns:
-            conn.execute("ALTER TABLE messages ADD COLUMN summarized INTEGER DEFAULT 0")
-        if "sender_id" not in columns:
-            conn.execute("ALTER TABLE messages ADD COLUMN sender_id INTEGER")
-        conn.commit()
+            # Проверяем наличие колонки summarized
+            columns = {
+                row[1] for row in conn.execute("PRAGMA table_info(messages)").fetchall()
+            }
+            if "summarized" not in columns:
+                conn.execute("ALTER TABLE messages ADD COLUMN summarized INTEGER DEFAULT 0")
+            if "sender_id" not in columns:
+                conn.execute("ALTER TABLE messages ADD COLUMN sender_id INTEGER")
+
+            # Даты храним в миллисекундах Unix (UTC); старые ISO-строки переводим
+            conn.execute(
+                "UPDATE messages"
+                " SET date = CAST(ROUND((julianday(date) - 2440587.5) * 86400000) AS INTEGER)"
+                " WHERE typeof(date) = 'text' AND julianday(date) IS NOT NULL"
+            )
+
+            # Индекс под выборку несуммаризованных сообщений (WHERE summarized ORDER BY date)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_summarized_date "
+                "ON messages(summarized, date)"
+            )
+            # Индекс под постраничный вывод всех сообщений (ORDER BY date)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_date ON messages(date)")
+
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        _schema_ready = True
 
 
 def fetch_unsummarized(limit: int = 50) -> List[sqlite3.Row]:
     """
     Возвращает последние несуммаризованные сообщения (по дате, новые сверху).
     """
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.execute(
-            """
-            SELECT id, chat_id, sender, sender_id, text, date
-            FROM messages
-            WHERE summarized = 0
-            ORDER BY date DESC
-            LIMIT ?
-            """,
-            (limit,),
-        )
+    with _lock:
+        cursor = _get_conn().execute(_SQL_FETCH_UNSUMMARIZED, (limit,))
         return cursor.fetchall()
 
 
@@ -65,11 +129,17 @@ def mark_summarized(message_ids: Sequence[int]) -> None:
     """Помечает сообщения как суммаризованные."""
     if not message_ids:
         return
-    with sqlite3.connect(DB_PATH) as conn:
-        placeholders = ",".join("?" for _ in message_ids)
-        conn.execute(
-            f"UPDATE messages SET summarized = 1 WHERE id IN ({placeholders})",
-            tuple(message_ids),
-        )
-        conn.commit()
-
+    with _lock:
+        conn = _get_conn()
+        # Один подготовленный UPDATE на все id в одной транзакции:
+        # не упираемся в лимит числа параметров SQLite и делаем один fsync
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                _SQL_MARK_SUMMARIZED,
+                ((message_id,) for message_id in message_ids),
+            )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
@@ -3,32 +3,35 @@
 Обеспечивает получение токена доступа и генерацию выжимок текста.
 """
 
-import requests
+import asyncio
+import aiohttp
+import json
 import logging
-from typing import Optional
+import logging.handlers
+import queue
+from typing import Any, Optional, Tuple
 from dotenv import load_dotenv
 import os
-import urllib3
 import uuid
+import time
 from datetime import datetime
 
-# Отключаем предупреждения о небезопасных SSL сертификатах
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
 # Загружаем переменные окружения из .env
 load_dotenv()
 
 logger = logging.getLogger(__name__)
-# Добавляем файловый логгер для трассировки запросов/ответов GigaChat
-if not logger.handlers:
-    log_file = os.path.join(os.path.dirname(__file__), "gigachat.log")
-    file_handler = logging.FileHandler(log_file, encoding="utf-8")
-    formatter = logging.Formatter(
-        "%(asctime)s - %(levelname)s - %(message)s"
-    )
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    logger.setLevel(logging.INFO)
+
+# orjson (если установлен) заметно быстрее разбирает большие ответы chat/completions
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
 
 # URL эндпоинтов GigaChat API
 OAUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
@@ -38,6 +41,58 @@ CHAT_COMPLETIONS_URL = "https://gigachat.devices.sberbank.ru/api/v1/chat/complet
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 
+# Общая HTTP-сессия (создается лениво внутри работающего event loop)
+_session: Optional[aiohttp.ClientSession] = None
+
+# Токен живет ~30 минут; обновляем его с запасом до истечения срока
+TOKEN_EXPIRY_MARGIN = 300
+DEFAULT_TOKEN_TTL = 30 * 60
+
+# Текст короче этого порога (символов) возвращается как есть, без запроса к API
+MIN_SUMMARY_LENGTH = 200
+
+# Максимальная длина тела ответа в логах
+MAX_LOGGED_BODY = 2000
+
+# Кэш access token (expires_at — по часам time.monotonic())
+_token_cache = {"token": None, "expires_at": 0.0}
+_token_lock = asyncio.Lock()
+
+
+# Слушатель очереди логов (создается один раз в configure_logging)
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """
+    Включает файловый лог для трассировки запросов/ответов GigaChat.
+    Записи попадают в очередь, а в gigachat.log их пишет фоновый поток,
+    поэтому запись на диск не задерживает обработку запросов.
+    
+    Повторный вызов не добавляет обработчики и возвращает уже созданный слушатель.
+    
+    Returns:
+        QueueListener: Запущенный слушатель (остановить через listener.stop())
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return _log_listener
+
+    log_file = os.path.join(os.path.dirname(__file__), "gigachat.log")
+    file_handler = logging.FileHandler(log_file, encoding="utf-8")
+    formatter = logging.Formatter(
+        "%(asctime)s - %(levelname)s - %(message)s"
+    )
+    file_handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+
+    _log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _log_listener.start()
+    return _log_listener
+
 
 class GigaChatError(Exception):
     """Базовое исключение для ошибок GigaChat API"""
@@ -54,13 +109,122 @@ class GigaChatAPIError(GigaChatError):
     pass
 
 
-def get_access_token() -> str:
+async def get_session() -> aiohttp.ClientSession:
+    """
+    Возвращает общую aiohttp-сессию, создавая ее при первом обращении.
+    ssl=False отключает проверку SSL сертификата (для обхода проблем с сертификатами).
+    Соединения к OAuth и chat/completions держатся открытыми (keep-alive),
+    чтобы не повторять TCP+TLS handshake на каждый запрос.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                ssl=False,
+                limit=20,
+                limit_per_host=10,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+        )
+    return _session
+
+
+async def close_session() -> None:
+    """Закрывает общую HTTP-сессию (вызывается при остановке приложения)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def _read_json(response: aiohttp.ClientResponse) -> tuple[Optional[Any], str]:
+    """
+    Читает тело ответа один раз и разбирает его как JSON.
+    
+    Returns:
+        tuple: Разобранный JSON (None, если тело не JSON) и исходный текст,
+            если тело не удалось разобрать (иначе пустая строка)
+    """
+    body = await response.read()
+    try:
+        return _json_loads(body), ""
+    except ValueError:
+        return None, body.decode("utf-8", errors="replace")
+
+
+def _log_request(url: str, payload: Any, headers: dict) -> None:
+    """Логирует запрос к GigaChat, скрывая заголовок Authorization."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "GigaChat request: method=POST url=%s payload=%s headers=%s",
+            url,
+            payload,
+            {k: ("***" if k.lower() == "authorization" else v) for k, v in headers.items()},
+        )
+
+
+def _log_response(status: int, data: Any) -> None:
+    """Логирует ответ GigaChat, обрезая слишком длинное тело."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "GigaChat response: status=%s body=%s",
+            status,
+            repr(data)[:MAX_LOGGED_BODY],
+        )
+
+
+def invalidate_access_token() -> None:
+    """Сбрасывает закэшированный access token (например, после ответа 401)."""
+    _token_cache["token"] = None
+    _token_cache["expires_at"] = 0.0
+
+
+async def get_access_token() -> str:
+    """
+    Возвращает OAuth токен доступа для работы с GigaChat API.
+    Токен кэшируется и запрашивается заново только незадолго до истечения срока.
+    
+    Returns:
+        str: Access token для использования в API запросах
+    
+    Raises:
+        GigaChatAuthError: При ошибке аутентификации
+    """
+    async with _token_lock:
+        if _token_cache["token"] and time.monotonic() < _token_cache["expires_at"]:
+            return _token_cache["token"]
+
+        access_token, expires_at_ms = await _fetch_access_token()
+
+        # GigaChat возвращает expires_at в миллисекундах (unix time)
+        if expires_at_ms:
+            ttl = expires_at_ms / 1000 - time.time()
+        else:
+            ttl = DEFAULT_TOKEN_TTL
+        _token_cache["token"] = access_token
+        _token_cache["expires_at"] = time.monotonic() + ttl - TOKEN_EXPIRY_MARGIN
+        return access_token
+
+
+async def prefetch_access_token() -> None:
+    """
+    Заранее получает и кэширует access token, не прерывая вызывающий код.
+    Ошибка будет повторно получена и поднята при фактическом запросе к API.
+    """
+    try:
+        await get_access_token()
+    except GigaChatError as e:
+        logger.warning("Не удалось заранее получить access token: %s", e)
+
+
+async def _fetch_access_token() -> tuple[str, Optional[int]]:
     """
     Получает OAuth токен доступа для работы с GigaChat API.
     Использует Basic авторизацию через заголовок Authorization.
     
     Returns:
-        str: Access token для использования в API запросах
+        tuple: Access token и время истечения (expires_at, мс)
     
     Raises:
         GigaChatAuthError: При ошибке аутентификации
@@ -93,46 +257,32 @@ def get_access_token() -> str:
         }
         
         # Отправляем POST запрос
-        # verify=False отключает проверку SSL сертификата (для обхода проблем с сертификатами)
-        logger.info(
-            "GigaChat request: method=POST url=%s payload=%s headers=%s",
-            OAUTH_URL,
-            payload,
-            {k: ("***" if k.lower() == "authorization" else v) for k, v in headers.items()},
-        )
-        response = requests.post(
+        _log_request(OAUTH_URL, payload, headers)
+        session = await get_session()
+        async with session.post(
             OAUTH_URL,
             headers=headers,
             data=payload,
-            verify=False,
-            timeout=30
-        )
-        
-        # Проверяем статус ответа
-        if response.status_code != 200:
-            error_msg = f"Ошибка аутентификации: {response.status_code}"
-            try:
-                error_detail = response.json()
-                error_msg += f" - {error_detail}"
-            except:
-                error_msg += f" - {response.text}"
+            timeout=aiohttp.ClientTimeout(total=30)
+        ) as response:
+            token_data, body = await _read_json(response)
+
+            # Проверяем статус ответа
+            if response.status != 200:
+                error_msg = f"Ошибка аутентификации: {response.status}"
+                error_msg += f" - {token_data if token_data is not None else body}"
+                
+                logger.error(error_msg)
+                raise GigaChatAuthError(error_msg)
             
+            # Логируем ответ
+            _log_response(response.status, token_data if token_data is not None else body)
+
+        # Извлекаем токен из уже разобранного ответа
+        if not isinstance(token_data, dict):
+            error_msg = "Неожиданный формат ответа при получении токена"
             logger.error(error_msg)
             raise GigaChatAuthError(error_msg)
-        
-        # Логируем ответ (без токена)
-        try:
-            resp_json = response.json()
-        except Exception:
-            resp_json = response.text
-        logger.info(
-            "GigaChat response: status=%s body=%s",
-            response.status_code,
-            resp_json,
-        )
-
-        # Парсим ответ и извлекаем токен
-        token_data = response.json()
         access_token = token_data.get("access_token")
         
         if not access_token:
@@ -141,9 +291,11 @@ def get_access_token() -> str:
             raise GigaChatAuthError(error_msg)
         
         logger.info("Access token успешно получен")
-        return access_token
+        return access_token, token_data.get("expires_at")
         
-    except requests.exceptions.RequestException as e:
+    except GigaChatAuthError:
+        raise
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         error_msg = f"Ошибка сети при получении токена: {e}"
         logger.error(error_msg)
         raise GigaChatAuthError(error_msg)
@@ -153,7 +305,7 @@ def get_access_token() -> str:
         raise GigaChatAuthError(error_msg)
 
 
-def _call_chat_api(messages: list[dict], model: str = "GigaChat") -> str:
+async def _call_chat_api(messages: list[dict], model: str = "GigaChat") -> str:
     """
     Делает вызов chat/completions и возвращает текст ответа.
     Используется как для summary, так и для произвольных чат-запросов.
@@ -162,55 +314,49 @@ def _call_chat_api(messages: list[dict], model: str = "GigaChat") -> str:
         raise ValueError("Список сообщений пуст")
 
     try:
-        access_token = get_access_token()
-
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-
         payload = {
             "model": model,
             "messages": messages
         }
 
-        logger.info(
-            "GigaChat request: method=POST url=%s payload=%s headers=%s",
-            CHAT_COMPLETIONS_URL,
-            payload,
-            {"Content-Type": headers["Content-Type"], "Accept": headers["Accept"], "Authorization": "***"},
-        )
+        # Вторая попытка нужна, если закэшированный токен отозван раньше срока (401)
+        for attempt in range(2):
+            access_token = await get_access_token()
 
-        response = requests.post(
-            CHAT_COMPLETIONS_URL,
-            headers=headers,
-            json=payload,
-            timeout=30,
-            verify=False
-        )
+            headers = {
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json",
+                "Accept": "application/json"
+            }
 
-        if response.status_code != 200:
-            error_msg = f"Ошибка API: {response.status_code}"
-            try:
-                error_detail = response.json()
-                error_msg += f" - {error_detail}"
-            except Exception:
-                error_msg += f" - {response.text}"
+            _log_request(CHAT_COMPLETIONS_URL, payload, headers)
 
-            logger.error(error_msg)
-            raise GigaChatAPIError(error_msg)
+            session = await get_session()
+            async with session.post(
+                CHAT_COMPLETIONS_URL,
+                headers=headers,
+                data=_json_dumps(payload),
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                if response.status == 401 and attempt == 0:
+                    logger.warning("GigaChat вернул 401, обновляем access token")
+                    invalidate_access_token()
+                    continue
 
-        try:
-            response_data = response.json()
-        except Exception:
-            response_data = {}
+                response_data, body = await _read_json(response)
 
-        logger.info(
-            "GigaChat response: status=%s body=%s",
-            response.status_code,
-            response_data if response_data else response.text,
-        )
+                if response.status != 200:
+                    error_msg = f"Ошибка API: {response.status}"
+                    error_msg += f" - {response_data if response_data is not None else body}"
+
+                    logger.error(error_msg)
+                    raise GigaChatAPIError(error_msg)
+
+                _log_response(response.status, response_data if response_data else body)
+            break
+
+        if not isinstance(response_data, dict):
+            response_data = {}
 
         if "choices" not in response_data or not response_data["choices"]:
             error_msg = "Неожиданный формат ответа API: отсутствует поле choices"
@@ -227,7 +373,7 @@ def _call_chat_api(messages: list[dict], model: str = "GigaChat") -> str:
 
     except GigaChatAuthError:
         raise
-    except requests.exceptions.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         error_msg = f"Ошибка сети при запросе к API: {e}"
         logger.error(error_msg)
         raise GigaChatAPIError(error_msg)
@@ -239,7 +385,7 @@ def _call_chat_api(messages: list[dict], model: str = "GigaChat") -> str:
         raise GigaChatAPIError(error_msg)
 
 
-def chat_completion(messages: list[dict], model: str = "GigaChat") -> str:
+async def chat_completion(messages: list[dict], model: str = "GigaChat") -> str:
     """
     Универсальный вызов GigaChat chat/completions.
 
@@ -248,10 +394,10 @@ def chat_completion(messages: list[dict], model: str = "GigaChat") -> str:
         model: имя модели (по умолчанию GigaChat)
     """
     logger.info("Запрос к GigaChat chat/completions")
-    return _call_chat_api(messages=messages, model=model)
+    return await _call_chat_api(messages=messages, model=model)
 
 
-def generate_summary(text: str) -> str:
+async def generate_summary(text: str) -> str:
     """
     Генерирует краткую выжимку (summary) текста через GigaChat API.
     
@@ -261,6 +407,26 @@ def generate_summary(text: str) -> str:
     Returns:
         str: Краткая выжимка текста
     
+    Raises:
+        GigaChatAPIError: При ошибке запроса к API
+        GigaChatAuthError: При ошибке аутентификации
+    """
+    summary, _ = await summarize_text(text)
+    return summary
+
+
+async def summarize_text(text: str) -> Tuple[str, bool]:
+    """
+    То же, что generate_summary, но сообщает, был ли текст возвращен без изменений.
+    Такой текст не прошел через GigaChat (исходный текст чата), поэтому его
+    нельзя отправлять с разметкой Markdown.
+    
+    Args:
+        text: Текст для обработки
+    
+    Returns:
+        Кортеж (выжимка, True если возвращен исходный текст)
+    
     Raises:
         GigaChatAPIError: При ошибке запроса к API
         GigaChatAuthError: При ошибке аутентификации
@@ -268,6 +434,11 @@ def generate_summary(text: str) -> str:
     if not text or not text.strip():
         raise ValueError("Текст не может быть пустым")
 
+    # Сокращать нечего — не тратим запрос к API
+    if len(text) < MIN_SUMMARY_LENGTH:
+        logger.info("Текст короче %s символов, выжимка не требуется", MIN_SUMMARY_LENGTH)
+        return text.strip(), True
+
     logger.info("Генерация выжимки текста через GigaChat API...")
 
     messages = [
@@ -281,5 +452,5 @@ def generate_summary(text: str) -> str:
         }
     ]
 
-    return _call_chat_api(messages=messages)
+    return await _call_chat_api(messages=messages), False
 
@@ -7,11 +7,18 @@ CLI-приложение для генерации выжимок текста 
 """
 
 import argparse
+import asyncio
 import sys
 import logging
 from pathlib import Path
 
-from bot.gigachat import generate_summary, GigaChatError, GigaChatAuthError, GigaChatAPIError
+from bot.gigachat import (
+    generate_summary,
+    close_session,
+    GigaChatError,
+    GigaChatAuthError,
+    GigaChatAPIError,
+)
 from bot.utils import read_file, validate_text
 
 # Настройка логирования
@@ -105,6 +112,22 @@ def get_text_from_args(args: argparse.Namespace) -> str:
     return text
 
 
+async def summarize(text: str) -> str:
+    """
+    Генерирует выжимку и закрывает HTTP-сессию GigaChat.
+    
+    Args:
+        text: Текст для обработки
+    
+    Returns:
+        str: Краткая выжимка текста
+    """
+    try:
+        return await generate_summary(text)
+    finally:
+        await close_session()
+
+
 def main():
     """
     Главная функция CLI-приложения.
@@ -126,7 +149,7 @@ def main():
             logger.info(f"Обработка текста ({len(text)} символов)...")
             
             # Генерируем выжимку
-            summary = generate_summary(text)
+            summary = asyncio.run(summarize(text))
             
             # Выводим результат
             print("\n" + "="*60)
@@ -8,18 +8,26 @@
     3) Запустите: python -m bot.main_telebot
 """
 
+import asyncio
 import logging
 import os
+import sqlite3
 import sys
-from typing import List, Dict
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
 
 import telebot
-from telebot.apihelper import ApiTelegramException
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException, RequestTimeout
 from dotenv import load_dotenv
 
 from bot.db import ensure_schema, fetch_unsummarized, mark_summarized
 from bot.gigachat import (
     generate_summary,
+    summarize_text,
+    prefetch_access_token,
+    close_session,
+    configure_logging,
     GigaChatAuthError,
     GigaChatAPIError,
 )
@@ -42,12 +50,23 @@ if not TELEGRAM_BOT_TOKEN:
     logger.error("TELEGRAM_BOT_TOKEN не задан. Укажите его в .env")
     raise SystemExit(1)
 
-# Создаем экземпляр бота
-bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN, parse_mode="Markdown")
+# Максимальная длина одного сообщения (запас от лимита Telegram 4096)
+MAX_MESSAGE_LENGTH = 3500
+
+# Длинный prompt (символов) суммаризуем по частям: группы по RECORDS_PER_GROUP
+# сообщений параллельно, затем общая выжимка по их результатам (map-reduce)
+MAP_REDUCE_THRESHOLD = 8000
+RECORDS_PER_GROUP = 50
+
+# Как часто обновлять индикатор "печатает" во время суммаризации, секунд
+TYPING_INTERVAL = 4
+
+# Создаем экземпляр бота (асинхронный, чтобы запросы к GigaChat не блокировали polling)
+bot = AsyncTeleBot(TELEGRAM_BOT_TOKEN, parse_mode="Markdown")
 
 
 @bot.message_handler(commands=["start", "help"])
-def handle_start(message: telebot.types.Message) -> None:
+async def handle_start(message: telebot.types.Message) -> None:
     """Приветственное сообщение и подсказка."""
     text = (
         "Привет! Я делаю выжимку сообщений из БД.\n"
@@ -55,73 +74,157 @@ def handle_start(message: telebot.types.Message) -> None:
         "/summary — суммаризация последних необработанных сообщений (по умолчанию 50).\n"
         "Сообщения в фоне не обрабатываю — только по команде."
     )
-    bot.reply_to(message, text)
+    await bot.reply_to(message, text)
 
 
-def _prepare_prompt(messages: List[Dict[str, str]]) -> str:
-    """Формирует текст для отправки в GigaChat."""
-    lines = []
-    for msg in messages:
-        sender = msg.get("sender", "unknown")
-        text = msg.get("text", "")
-        date = msg.get("date", "")
-        lines.append(f"[{date}] {sender}: {text}")
-    return "\n".join(lines)
+def _format_date(date_ms: Optional[int]) -> str:
+    """Дата из БД (миллисекунды Unix) в локальном времени."""
+    if date_ms is None:
+        return ""
+    return datetime.fromtimestamp(date_ms / 1000).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _prepare_prompt(records: Iterable[sqlite3.Row]) -> str:
+    """Формирует текст для отправки в GigaChat напрямую из строк БД."""
+    return "\n".join(
+        f"[{_format_date(row['date'])}] {row['sender'] or 'unknown'}: {row['text'] or ''}"
+        for row in records
+    )
 
 
-def _send_reply(chat_id: int, text: str, reply_to: int | None = None) -> None:
-    """Отправляет длинные ответы частями, чтобы не упасть по ограничению Telegram."""
+async def _summarize_records(records: List[sqlite3.Row]) -> Tuple[str, bool]:
+    """
+    Делает выжимку сообщений; длинные выборки обрабатывает по частям параллельно.
+    
+    Returns:
+        Кортеж (текст ответа, True если это исходный текст чата без обработки GigaChat)
+    """
+    prompt = _prepare_prompt(records)
+    # Одно сообщение пересказывать нет смысла — отдаем его как есть
+    if len(records) == 1:
+        return prompt, True
+    if len(prompt) <= MAP_REDUCE_THRESHOLD or len(records) <= RECORDS_PER_GROUP:
+        return await summarize_text(prompt)
+
+    groups = [
+        records[idx : idx + RECORDS_PER_GROUP]
+        for idx in range(0, len(records), RECORDS_PER_GROUP)
+    ]
+    logger.info("Длинная выборка: суммаризация %s частями", len(groups))
+    partial_summaries = await asyncio.gather(
+        *(generate_summary(_prepare_prompt(group)) for group in groups)
+    )
+    return await summarize_text("\n\n".join(partial_summaries))
+
+
+def _split_message(text: str, chunk_size: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    r"""
+    Делит текст на части не длиннее chunk_size по границам строк за один проход,
+    чтобы не разрезать Markdown-разметку посередине.
+    Строка длиннее chunk_size режется жестко. Части только из пробельных символов
+    (например, "\n", оставшийся после жесткого разреза) отбрасываются:
+    Telegram отвечает на них 400 "message text is empty".
+
+    >>> _split_message("x" * 3500 + "\n") == ["x" * 3500]
+    True
+    >>> [len(chunk) for chunk in _split_message("x" * 7000)]
+    [3500, 3500]
+    >>> text = "a" * 3499 + "\n\n\n"
+    >>> chunks = _split_message(text)
+    >>> all(chunk.strip() for chunk in chunks), "".join(chunks) == "a" * 3499 + "\n"
+    (True, True)
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    for line in text.splitlines(keepends=True):
+        while len(line) > chunk_size:
+            line_head, line = line[:chunk_size], line[chunk_size:]
+            if current:
+                chunks.append("".join(current))
+                current, current_len = [], 0
+            chunks.append(line_head)
+        if current_len + len(line) > chunk_size:
+            chunks.append("".join(current))
+            current, current_len = [], 0
+        current.append(line)
+        current_len += len(line)
+    if current:
+        chunks.append("".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+async def _send_reply(
+    chat_id: int, text: str, reply_to: int | None = None, markdown: bool = True
+) -> None:
+    """
+    Отправляет длинные ответы частями, чтобы не упасть по ограничению Telegram.
+    markdown=False — для исходного текста чата: одиночные "_" или "*" (Ivan_Petrov,
+    ссылки) ломают разбор Markdown, и Telegram отклоняет сообщение.
+    """
     if not text:
-        bot.send_message(chat_id, "Пустой ответ.", reply_to_message_id=reply_to)
+        await bot.send_message(chat_id, "Пустой ответ.", reply_to_message_id=reply_to)
         return
 
-    chunk_size = 3500  # запас от лимита 4096
-    for idx in range(0, len(text), chunk_size):
-        chunk = text[idx : idx + chunk_size]
-        bot.send_message(chat_id, chunk, reply_to_message_id=reply_to if idx == 0 else None)
+    # None — режим бота по умолчанию (Markdown), пустая строка — без разметки
+    parse_mode = None if markdown else ""
+    for idx, chunk in enumerate(_split_message(text)):
+        await bot.send_message(
+            chat_id,
+            chunk,
+            reply_to_message_id=reply_to if idx == 0 else None,
+            parse_mode=parse_mode,
+        )
+
+
+async def _keep_typing(chat_id: int) -> None:
+    """Поддерживает индикатор "печатает", пока задачу не отменят (Telegram гасит его через ~5 с)."""
+    while True:
+        try:
+            await bot.send_chat_action(chat_id, "typing")
+        except (ApiTelegramException, RequestTimeout) as e:
+            # Сбой индикатора не должен останавливать задачу до ее отмены
+            logger.debug("Не удалось отправить typing: %s", e)
+        await asyncio.sleep(TYPING_INTERVAL)
 
 
 @bot.message_handler(commands=["summary", "summarize", "summery"])
-def handle_summary(message: telebot.types.Message) -> None:
+async def handle_summary(message: telebot.types.Message) -> None:
     """Суммаризация последних необработанных сообщений из БД."""
-    bot.send_chat_action(message.chat.id, "typing")
+    typing_task = asyncio.create_task(_keep_typing(message.chat.id))
 
     # Парсим лимит из команды: /summary 30
     try:
-        parts = message.text.split()
-        limit = int(parts[1]) if len(parts) > 1 else 50
+        _, _, rest = message.text.partition(" ")
+        arg = rest.strip().partition(" ")[0]
+        limit = int(arg) if arg else 50
         limit = max(1, min(limit, 200))
     except ValueError:
         limit = 50
 
     try:
-        records = fetch_unsummarized(limit)
-        if not records:
-            bot.reply_to(message, "Нет новых сообщений для выжимки.")
-            return
-
-        # Формируем список словарей для prompt
-        payload: List[Dict[str, str]] = []
-        for row in records:
-            payload.append(
-                {
-                    "sender": row["sender"] or "unknown",
-                    "text": row["text"] or "",
-                    "date": row["date"] or "",
-                }
+        try:
+            # Выборка из БД идет параллельно с получением токена GigaChat
+            records, _ = await asyncio.gather(
+                asyncio.to_thread(fetch_unsummarized, limit),
+                prefetch_access_token(),
+            )
+            if not records:
+                await bot.reply_to(message, "Нет новых сообщений для выжимки.")
+                return
+
+            logger.info(
+                "Суммаризация: найдено %s сообщений (лимит %s), отправитель %s",
+                len(records),
+                limit,
+                message.from_user.id,
             )
 
-        prompt = _prepare_prompt(payload)
-        logger.info(
-            "Суммаризация: найдено %s сообщений (лимит %s), отправитель %s",
-            len(records),
-            limit,
-            message.from_user.id,
-        )
-
-        summary = generate_summary(prompt)
-        _send_reply(message.chat.id, summary, reply_to=message.id)
-        mark_summarized([row["id"] for row in records])
+            summary, is_raw = await _summarize_records(records)
+        finally:
+            typing_task.cancel()
+        await _send_reply(message.chat.id, summary, reply_to=message.id, markdown=not is_raw)
+        await asyncio.to_thread(mark_summarized, [row["id"] for row in records])
         logger.info(
             "Суммаризовано %s сообщений (лимит %s) пользователем %s",
             len(records),
@@ -130,34 +233,47 @@ def handle_summary(message: telebot.types.Message) -> None:
         )
     except ApiTelegramException as e:
         logger.error("Ошибка Telegram при отправке ответа: %s", e)
-        bot.reply_to(message, "Не смог отправить ответ в Telegram (слишком длинный?).")
+        await bot.reply_to(message, "Не смог отправить ответ в Telegram (слишком длинный?).")
     except GigaChatAuthError as e:
         logger.error("Ошибка аутентификации GigaChat: %s", e)
-        bot.reply_to(
+        await bot.reply_to(
             message,
             "Не удалось получить токен GigaChat. Проверь CLIENT_ID/CLIENT_SECRET.",
         )
     except GigaChatAPIError as e:
         logger.error("Ошибка GigaChat API: %s", e)
-        bot.reply_to(message, "GigaChat сейчас недоступен. Попробуй ещё раз позже.")
+        await bot.reply_to(message, "GigaChat сейчас недоступен. Попробуй ещё раз позже.")
     except Exception as e:  # noqa: BLE001
         logger.exception("Неожиданная ошибка при суммаризации: %s", e)
-        bot.reply_to(message, "Произошла ошибка. Попробуй повторить запрос.")
+        await bot.reply_to(message, "Произошла ошибка. Попробуй повторить запрос.")
 
 
 @bot.message_handler(content_types=["text"])
-def handle_text(message: telebot.types.Message) -> None:
+async def handle_text(message: telebot.types.Message) -> None:
     """Любые тексты не обрабатываем — подсказываем использовать /summary."""
-    bot.reply_to(
+    await bot.reply_to(
         message,
         "Я не обрабатываю сообщения в фоне. Используй команду /summarize или /summary.",
     )
 
 
+async def _run() -> None:
+    """Запускает polling и закрывает HTTP-сессии при остановке."""
+    try:
+        await bot.infinity_polling(skip_pending=True)
+    finally:
+        await close_session()
+        await bot.close_session()
+
+
 def main() -> None:
-    ensure_schema()
-    logger.info("Бот запущен и готов принимать команды суммаризации.")
-    bot.infinity_polling(skip_pending=True)
+    log_listener = configure_logging()
+    try:
+        ensure_schema()
+        logger.info("Бот запущен и готов принимать команды суммаризации.")
+        asyncio.run(_run())
+    finally:
+        log_listener.stop()
 
 
 if __name__ == "__main__":
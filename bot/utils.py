@@ -34,7 +34,8 @@ def read_file(file_path: str) -> str:
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
         
-        if not content.strip():
+        # isspace() проверяет строку без создания ее копии (в отличие от strip())
+        if not content or content.isspace():
             logger.warning("Файл пуст или содержит только пробелы")
         
         logger.info(f"Файл успешно прочитан ({len(content)} символов)")
@@ -2,18 +2,96 @@
 Flask-приложение для просмотра статистики и сообщений из базы данных.
 """
 
-from flask import Flask, render_template
+from flask import Flask, g, render_template, request
 import sqlite3
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, NamedTuple, Union
 
 # Путь к базе данных (в корне проекта)
 DB_PATH = Path(__file__).resolve().parent.parent / "telegram_messages.db"
 
+# Тексты запросов вынесены в константы, чтобы sqlite3 переиспользовал
+# подготовленные выражения из своего кэша
+_SQL_STATS = """
+    SELECT
+        COUNT(*),
+        SUM(CASE WHEN summarized = 1 THEN 1 ELSE 0 END),
+        MAX(CASE WHEN summarized = 1 THEN date END)
+    FROM messages
+"""
+_SQL_COUNT = "SELECT COUNT(*) FROM messages"
+_SQL_MESSAGES_PAGE = """
+    SELECT id, chat_id, sender, sender_id, text, date, summarized
+    FROM messages
+    ORDER BY date DESC
+    LIMIT ? OFFSET ?
+"""
+
+# Размер страницы списка сообщений по умолчанию и максимальный
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
 app = Flask(__name__)
 
 
+class Message(NamedTuple):
+    """Сообщение для вывода на странице (легче словаря по памяти)."""
+    id: int
+    chat_id: int
+    sender: str
+    sender_id: Optional[int]
+    text: str
+    date: Optional[datetime]
+    date_str: Optional[str]
+    summarized: bool
+
+
+def get_db() -> sqlite3.Connection:
+    """
+    Возвращает read-only соединение с БД для текущего запроса.
+    Соединение хранится в flask.g и закрывается по окончании запроса.
+    """
+    if "db" not in g:
+        g.db = sqlite3.connect(f"{DB_PATH.as_uri()}?mode=ro", uri=True)
+        g.db.row_factory = sqlite3.Row
+    return g.db
+
+
+@app.teardown_appcontext
+def close_db(exc: Optional[BaseException]) -> None:
+    """Закрывает соединение с БД после обработки запроса."""
+    db = g.pop("db", None)
+    if db is not None:
+        db.close()
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value: Union[int, str]) -> Optional[datetime]:
+    """
+    Переводит дату из БД в локальное время.
+    Новые записи хранят миллисекунды Unix; строки (ISO 8601 или
+    "%Y-%m-%d %H:%M:%S") остаются в базах, еще не прошедших миграцию.
+    Результат кэшируется: у пачки сообщений часто совпадают отметки времени.
+    
+    Returns:
+        datetime или None, если формат не распознан
+    """
+    if isinstance(value, int):
+        return datetime.fromtimestamp(value / 1000)
+    try:
+        if value.endswith('Z'):
+            return datetime.fromisoformat(value[:-1] + '+00:00')
+        return datetime.fromisoformat(value)
+    except (ValueError, AttributeError, TypeError):
+        # Если формат другой, пробуем просто распарсить
+        try:
+            return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+        except (ValueError, TypeError):
+            return None
+
+
 def get_db_stats() -> Dict:
     """
     Получает статистику из базы данных.
@@ -28,82 +106,67 @@ def get_db_stats() -> Dict:
     }
     
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            
-            # Всего сообщений
-            cursor.execute("SELECT COUNT(*) FROM messages")
-            stats["total_messages"] = cursor.fetchone()[0]
-            
-            # Проанализировано сообщений
-            cursor.execute("SELECT COUNT(*) FROM messages WHERE summarized = 1")
-            stats["analyzed_messages"] = cursor.fetchone()[0]
-            
-            # Дата последней выжимки (максимальная дата среди проанализированных)
-            cursor.execute(
-                "SELECT MAX(date) FROM messages WHERE summarized = 1"
-            )
-            result = cursor.fetchone()[0]
-            if result:
-                # Парсим дату из строки
-                try:
-                    stats["last_summary_date"] = datetime.fromisoformat(result.replace('Z', '+00:00'))
-                except (ValueError, AttributeError):
-                    # Если формат другой, пробуем просто распарсить
-                    try:
-                        stats["last_summary_date"] = datetime.strptime(result, "%Y-%m-%d %H:%M:%S")
-                    except ValueError:
-                        stats["last_summary_date"] = None
-            
+        # Всего сообщений, проанализировано сообщений и дата последней выжимки
+        # (максимальная дата среди проанализированных) — за один проход по таблице
+        total, analyzed, result = get_db().execute(_SQL_STATS).fetchone()
+        stats["total_messages"] = total
+        stats["analyzed_messages"] = analyzed or 0
+        
+        if result is not None:
+            stats["last_summary_date"] = parse_date(result)
+        
     except Exception as e:
         print(f"Ошибка при получении статистики: {e}")
     
     return stats
 
 
-def get_all_messages() -> List[Dict]:
+def get_message_count() -> int:
+    """
+    Получает общее количество сообщений в базе данных.
+    
+    Returns:
+        int: Количество сообщений
+    """
+    try:
+        return get_db().execute(_SQL_COUNT).fetchone()[0]
+    except Exception as e:
+        print(f"Ошибка при подсчете сообщений: {e}")
+        return 0
+
+
+def get_all_messages(page: int = 1, per_page: int = DEFAULT_PER_PAGE) -> List[Message]:
     """
-    Получает все сообщения из базы данных.
+    Получает одну страницу сообщений из базы данных (новые сверху).
+    
+    Args:
+        page: Номер страницы, начиная с 1
+        per_page: Количество сообщений на странице
     
     Returns:
-        list: Список словарей с сообщениями
+        list: Список сообщений
     """
     messages = []
     
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute(
-                """
-                SELECT id, chat_id, sender, sender_id, text, date, summarized
-                FROM messages
-                ORDER BY date DESC
-                """
-            )
+        cursor = get_db().execute(_SQL_MESSAGES_PAGE, (per_page, (page - 1) * per_page))
+        
+        for row in cursor:
+            # Парсим дату
+            raw_date = row["date"]
+            date_obj = parse_date(raw_date) if raw_date is not None else None
+            date_str = str(raw_date) if raw_date is not None else None
             
-            for row in cursor.fetchall():
-                # Парсим дату
-                date_str = row["date"]
-                date_obj = None
-                if date_str:
-                    try:
-                        date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                    except (ValueError, AttributeError):
-                        try:
-                            date_obj = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
-                        except ValueError:
-                            date_obj = None
-                
-                messages.append({
-                    "id": row["id"],
-                    "chat_id": row["chat_id"],
-                    "sender": row["sender"] or "Неизвестно",
-                    "sender_id": row["sender_id"],
-                    "text": row["text"] or "[без текста]",
-                    "date": date_obj,
-                    "date_str": date_str,
-                    "summarized": bool(row["summarized"])
-                })
+            messages.append(Message(
+                id=row["id"],
+                chat_id=row["chat_id"],
+                sender=row["sender"] or "Неизвестно",
+                sender_id=row["sender_id"],
+                text=row["text"] or "[без текста]",
+                date=date_obj,
+                date_str=date_str,
+                summarized=bool(row["summarized"]),
+            ))
     
     except Exception as e:
         print(f"Ошибка при получении сообщений: {e}")
@@ -120,9 +183,23 @@ def index():
 
 @app.route('/messages')
 def messages():
-    """Страница со списком всех сообщений."""
-    messages_list = get_all_messages()
-    return render_template('messages.html', messages=messages_list)
+    """Страница со списком сообщений (постранично: ?page=&per_page=)."""
+    per_page = request.args.get('per_page', DEFAULT_PER_PAGE, type=int)
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    total = get_message_count()
+    pages = max(1, -(-total // per_page))
+    page = request.args.get('page', 1, type=int)
+    page = max(1, min(page, pages))
+
+    messages_list = get_all_messages(page, per_page)
+    return render_template(
+        'messages.html',
+        messages=messages_list,
+        total=total,
+        page=page,
+        pages=pages,
+        per_page=per_page,
+    )
 
 
 if __name__ == '__main__':
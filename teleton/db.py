@@ -4,64 +4,373 @@
 """
 
 import aiosqlite
+import asyncio
 import logging
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 # Путь к файлу базы данных
 DB_PATH = "telegram_messages.db"
 
+# Настройки, действующие в пределах одного соединения:
+# меньше fsync при коммите, кэш страниц 16 МБ, mmap 256 МБ, ожидание блокировки,
+# размер WAL-файла после чекпоинта не больше 10 МБ
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA journal_size_limit=10485760",
+)
+
+# Перевод старых дат-строк (ISO 8601) в миллисекунды Unix; julianday учитывает смещение
+_MIGRATE_DATES_SQL = (
+    "UPDATE messages"
+    " SET date = CAST(ROUND((julianday(date) - 2440587.5) * 86400000) AS INTEGER)"
+    " WHERE typeof(date) = 'text' AND julianday(date) IS NOT NULL"
+)
+
+# Версия схемы БД (PRAGMA user_version); та же, что SCHEMA_VERSION в bot/db.py —
+# увеличивать в обоих модулях вместе с изменением схемы
+SCHEMA_VERSION = 2
+
+# Общее соединение с БД (открывается один раз и переиспользуется)
+_DB: Optional[aiosqlite.Connection] = None
+# Отдельные соединения (у каждого свой поток aiosqlite): для загрузки истории,
+# чтобы она не ждала коммитов live-слушателя, и только для чтения — под подсчеты
+_bulk_db: Optional[aiosqlite.Connection] = None
+_read_db: Optional[aiosqlite.Connection] = None
+
+# Вставка сообщения; дубли (id, chat_id) пропускаются благодаря INSERT OR IGNORE.
+# Один и тот же текст запроса позволяет sqlite3 брать подготовленное выражение из кэша
+_INSERT_SQL = (
+    "INSERT OR IGNORE INTO messages"
+    " (id, chat_id, sender, sender_id, text, date, summarized)"
+    " VALUES (?, ?, ?, ?, ?, ?, 0)"
+)
+
+# Пакетная запись: коммит после WRITE_BATCH_SIZE строк или через WRITE_FLUSH_INTERVAL
+# секунд после первой строки в пачке (всплеск сообщений в группе — один коммит)
+WRITE_BATCH_SIZE = 50
+WRITE_FLUSH_INTERVAL = 0.2
+
+# Период фонового PRAGMA optimize, секунд
+OPTIMIZE_INTERVAL = 15 * 60
+_maintenance_task: Optional[asyncio.Task] = None
+
+# Счетчики сообщений в памяти: загружаются в init_db и обновляются при вставке,
+# чтобы не сканировать таблицу через COUNT(*) (None — еще не загружены)
+_total_count: Optional[int] = None
+_per_chat_count: Dict[int, int] = {}
+
+# Очередь строк на запись и фоновая задача-писатель (см. start_writer)
+_write_queue: Optional[asyncio.Queue] = None
+_writer_task: Optional[asyncio.Task] = None
+
+
+async def get_db() -> aiosqlite.Connection:
+    """
+    Возвращает общее соединение с базой данных, открывая его при первом обращении.
+    
+    Returns:
+        aiosqlite.Connection: Открытое соединение
+    """
+    global _DB
+    if _DB is None:
+        _DB = await _connect()
+    return _DB
+
+
+async def get_bulk_db() -> aiosqlite.Connection:
+    """Возвращает соединение для пакетной загрузки истории (collect_messages)."""
+    global _bulk_db
+    if _bulk_db is None:
+        _bulk_db = await _connect()
+    return _bulk_db
+
+
+async def get_read_db() -> aiosqlite.Connection:
+    """Возвращает соединение только для чтения: оно не берет блокировку записи."""
+    global _read_db
+    if _read_db is None:
+        _read_db = await _connect("PRAGMA query_only=1")
+    return _read_db
+
+
+async def _connect(*extra_pragmas: str) -> aiosqlite.Connection:
+    """Открывает соединение с БД и применяет настройки соединения."""
+    db = await aiosqlite.connect(DB_PATH)
+    for pragma in (*_CONNECTION_PRAGMAS, *extra_pragmas):
+        await db.execute(pragma)
+    return db
+
+
+async def optimize_db() -> None:
+    """Обновляет статистику планировщика запросов (PRAGMA optimize)."""
+    db = await get_db()
+    await db.execute("PRAGMA optimize")
+
+
+async def _periodic_optimize() -> None:
+    """Фоновая задача: периодически выполняет PRAGMA optimize."""
+    while True:
+        await asyncio.sleep(OPTIMIZE_INTERVAL)
+        try:
+            await optimize_db()
+        except Exception as e:
+            logger.warning(f"Не удалось выполнить PRAGMA optimize: {e}")
+
+
+def start_maintenance() -> None:
+    """Запускает периодическое обслуживание БД (для долгоживущего live-слушателя)."""
+    global _maintenance_task
+    if _maintenance_task is None:
+        _maintenance_task = asyncio.create_task(_periodic_optimize())
+
+
+async def close_db() -> None:
+    """
+    Закрывает соединения с базой данных.
+    Перед закрытием общего соединения обновляет статистику и переносит WAL в основной файл БД.
+    """
+    global _DB, _bulk_db, _read_db, _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        _maintenance_task = None
+    for extra in (_bulk_db, _read_db):
+        if extra is not None:
+            await extra.close()
+    _bulk_db = _read_db = None
+    if _DB is not None:
+        try:
+            await _DB.execute("PRAGMA optimize")
+            await _DB.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception as e:
+            logger.warning(f"Не удалось обслужить БД перед закрытием: {e}")
+        await _DB.close()
+        _DB = None
+
 
 async def _ensure_schema(db: aiosqlite.Connection) -> None:
-    """Добавляет недостающие колонки без потери данных."""
-    cursor = await db.execute("PRAGMA table_info(messages)")
-    columns = await cursor.fetchall()
-    column_names = {row[1] for row in columns}
+    """
+    Добавляет недостающие колонки и индексы без потери данных.
+    Изменения выполняются одной транзакцией и только один раз:
+    версия схемы хранится в PRAGMA user_version (общая с bot.db).
+    """
+    cursor = await db.execute("PRAGMA user_version")
+    (version,) = await cursor.fetchone()
+    if version >= SCHEMA_VERSION:
+        return
+
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = await db.execute("PRAGMA table_info(messages)")
+        columns = await cursor.fetchall()
+        column_names = {row[1] for row in columns}
+
+        # Колонка для отметки суммаризации
+        if "summarized" not in column_names:
+            await db.execute("ALTER TABLE messages ADD COLUMN summarized INTEGER DEFAULT 0")
+            logger.info("Добавлена колонка summarized в таблицу messages")
+
+        # Колонка идентификатора отправителя
+        if "sender_id" not in column_names:
+            await db.execute("ALTER TABLE messages ADD COLUMN sender_id INTEGER")
+            logger.info("Добавлена колонка sender_id в таблицу messages")
 
-    # Колонка для отметки суммаризации
-    if "summarized" not in column_names:
-        await db.execute("ALTER TABLE messages ADD COLUMN summarized INTEGER DEFAULT 0")
-        logger.info("Добавлена колонка summarized в таблицу messages")
+        # Даты храним как INTEGER (миллисекунды Unix, UTC) — переводим старые строки
+        cursor = await db.execute(_MIGRATE_DATES_SQL)
+        if cursor.rowcount > 0:
+            logger.info(f"Даты {cursor.rowcount} сообщений переведены в миллисекунды Unix")
 
-    # Колонка идентификатора отправителя
-    if "sender_id" not in column_names:
-        await db.execute("ALTER TABLE messages ADD COLUMN sender_id INTEGER")
-        logger.info("Добавлена колонка sender_id в таблицу messages")
+        # Индексы bot.db: под выборку несуммаризованных сообщений
+        # и под постраничный вывод всех сообщений
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_summarized_date "
+            "ON messages(summarized, date)"
+        )
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_messages_date ON messages(date)")
 
+        await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    except Exception:
+        await db.rollback()
+        raise
     await db.commit()
 
 
 async def init_db():
     """
     Инициализация базы данных.
-    Создает таблицу messages, если она не существует.
+    Включает WAL-журнал и создает таблицу messages, если она не существует.
     """
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY,
-                    chat_id INTEGER NOT NULL,
-                    sender TEXT,
-                    sender_id INTEGER,
-                    text TEXT,
-                    date TIMESTAMP,
-                    summarized INTEGER DEFAULT 0,
-                    UNIQUE(id, chat_id)
-                )
-                """
+        db = await get_db()
+        # Режим WAL сохраняется в заголовке файла БД, достаточно включить его один раз:
+        # коммит становится дозаписью в WAL, а читатели не блокируют писателя
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                sender TEXT,
+                sender_id INTEGER,
+                text TEXT,
+                date INTEGER,
+                summarized INTEGER DEFAULT 0,
+                UNIQUE(id, chat_id)
             )
-            await _ensure_schema(db)
-            await db.commit()
-            logger.info("База данных инициализирована успешно")
+            """
+        )
+        await _ensure_schema(db)
+
+        # Индекс под выборки и подсчет по чату (WHERE chat_id = ? / GROUP BY chat_id)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_chat_date ON messages(chat_id, date)"
+        )
+        # Обновляем статистику планировщика; analysis_limit ограничивает стоимость ANALYZE
+        await db.execute("PRAGMA analysis_limit=1000")
+        await db.execute("ANALYZE")
+        await db.commit()
+
+        await _load_counts(db)
+        logger.info("База данных инициализирована успешно")
     except Exception as e:
         logger.error(f"Ошибка при инициализации базы данных: {e}")
         raise
 
 
+async def _load_counts(db: aiosqlite.Connection) -> None:
+    """Один раз считает сообщения (всего и по чатам) для счетчиков в памяти."""
+    global _total_count
+    cursor = await db.execute("SELECT chat_id, COUNT(*) FROM messages GROUP BY chat_id")
+    _per_chat_count.clear()
+    _per_chat_count.update(await cursor.fetchall())
+    _total_count = sum(_per_chat_count.values())
+
+
+def _add_counts(chat_id: int, inserted: int) -> None:
+    """Учитывает новые сообщения в счетчиках."""
+    global _total_count
+    if _total_count is None or not inserted:
+        return
+    _total_count += inserted
+    _per_chat_count[chat_id] = _per_chat_count.get(chat_id, 0) + inserted
+
+
+def _to_unix_ms(date: datetime) -> int:
+    """Дата в миллисекундах Unix (UTC); время без часового пояса считается UTC."""
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp() * 1000)
+
+
+async def save_messages_bulk(rows: List[tuple], bulk: bool = False) -> int:
+    """
+    Сохранение пачки сообщений одним executemany в одной транзакции.
+    
+    Args:
+        rows: Кортежи (id, chat_id, sender, sender_id, text, date)
+        bulk: Писать через отдельное соединение загрузки истории
+    
+    Returns:
+        Количество новых сообщений (дубли пропускаются)
+    """
+    if not rows:
+        return 0
+    # Группируем по чатам, чтобы rowcount каждого executemany относился к одному чату
+    by_chat: Dict[int, List[tuple]] = {}
+    for row in rows:
+        by_chat.setdefault(row[1], []).append((*row[:5], _to_unix_ms(row[5])))
+
+    db = await (get_bulk_db() if bulk else get_db())
+    try:
+        inserted: Dict[int, int] = {}
+        for chat_id, chat_rows in by_chat.items():
+            cursor = await db.executemany(_INSERT_SQL, chat_rows)
+            inserted[chat_id] = cursor.rowcount
+        await db.commit()
+        for chat_id, count in inserted.items():
+            _add_counts(chat_id, count)
+        total = sum(inserted.values())
+        logger.debug("Записано %s из %s сообщений (остальные — дубли)", total, len(rows))
+        return total
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Ошибка при пакетном сохранении сообщений в БД: {e}")
+        return 0
+
+
+async def read_batch(
+    queue: asyncio.Queue, max_size: int, interval: float
+) -> Tuple[List[tuple], bool]:
+    """
+    Ждет первую строку в очереди и добирает пачку до max_size строк
+    или пока не истечет interval секунд. None в очереди — сигнал остановки.
+    
+    Returns:
+        Пачка строк и признак того, что получен сигнал остановки
+    """
+    loop = asyncio.get_running_loop()
+    row = await queue.get()
+    if row is None:
+        queue.task_done()
+        return [], True
+    rows = [row]
+    deadline = loop.time() + interval
+    while len(rows) < max_size:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            row = await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            break
+        if row is None:
+            queue.task_done()
+            return rows, True
+        rows.append(row)
+    return rows, False
+
+
+async def _writer() -> None:
+    """Фоновая задача: забирает строки из очереди и пишет их пачками."""
+    stopping = False
+    while not stopping:
+        rows, stopping = await read_batch(_write_queue, WRITE_BATCH_SIZE, WRITE_FLUSH_INTERVAL)
+        if rows:
+            await save_messages_bulk(rows)
+            for _ in rows:
+                _write_queue.task_done()
+
+
+async def start_writer() -> None:
+    """Запускает фоновую пакетную запись сообщений."""
+    global _write_queue, _writer_task
+    if _writer_task is None:
+        _write_queue = asyncio.Queue()
+        _writer_task = asyncio.create_task(_writer())
+
+
+async def flush_writes() -> None:
+    """Ждет, пока все поставленные в очередь сообщения будут записаны."""
+    if _write_queue is not None:
+        await _write_queue.join()
+
+
+async def stop_writer() -> None:
+    """Дописывает накопленные сообщения и останавливает фоновую запись."""
+    global _write_queue, _writer_task
+    if _writer_task is not None:
+        _write_queue.put_nowait(None)
+        await _writer_task
+        _write_queue = None
+        _writer_task = None
+
+
 async def save_message(
     message_id: int,
     chat_id: int,
@@ -72,41 +381,46 @@ async def save_message(
 ) -> bool:
     """
     Сохранение сообщения в базу данных.
+    Если запущена фоновая запись (start_writer), сообщение только ставится в очередь.
     
     Args:
         message_id: ID сообщения в Telegram
         chat_id: ID чата
         sender: Имя отправителя
         text: Текст сообщения
-        date: Дата и время сообщения
+        date: Дата и время сообщения (в БД хранится в миллисекундах Unix)
     
     Returns:
-        True если сообщение сохранено, False если уже существует (дубль)
+        True если сообщение сохранено (или поставлено в очередь),
+        False если уже существует (дубль)
     """
+    if _write_queue is not None:
+        _write_queue.put_nowait((message_id, chat_id, sender, sender_id, text, date))
+        return True
+
+    date_ms = _to_unix_ms(date)
+
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Попытка вставить сообщение
-            # Если сообщение уже существует (дубль), SQLite вернет ошибку
-            # Используем INSERT OR IGNORE для пропуска дублей
-            cursor = await db.execute(
-                """
-                INSERT OR IGNORE INTO messages
-                    (id, chat_id, sender, sender_id, text, date, summarized)
-                VALUES (?, ?, ?, ?, ?, ?, 0)
-                """,
-                (message_id, chat_id, sender, sender_id, text, date),
-            )
-            
-            await db.commit()
+        db = await get_db()
+        # Попытка вставить сообщение
+        # Если сообщение уже существует (дубль), SQLite вернет ошибку
+        # Используем INSERT OR IGNORE для пропуска дублей
+        cursor = await db.execute(
+            _INSERT_SQL,
+            (message_id, chat_id, sender, sender_id, text, date_ms),
+        )
+        
+        await db.commit()
+        
+        # Если была вставлена новая строка, affected_rows будет > 0
+        if cursor.rowcount > 0:
+            _add_counts(chat_id, cursor.rowcount)
+            logger.debug("Сообщение %s из чата %s сохранено в БД", message_id, chat_id)
+            return True
+        else:
+            logger.debug("Сообщение %s из чата %s уже существует (дубль)", message_id, chat_id)
+            return False
             
-            # Если была вставлена новая строка, affected_rows будет > 0
-            if cursor.rowcount > 0:
-                logger.debug(f"Сообщение {message_id} из чата {chat_id} сохранено в БД")
-                return True
-            else:
-                logger.debug(f"Сообщение {message_id} из чата {chat_id} уже существует (дубль)")
-                return False
-                
     except Exception as e:
         logger.error(f"Ошибка при сохранении сообщения в БД: {e}")
         return False
@@ -115,6 +429,7 @@ async def save_message(
 async def get_message_count(chat_id: Optional[int] = None) -> int:
     """
     Получить количество сообщений в базе данных.
+    После init_db значение берется из счетчиков в памяти, без запроса к БД.
     
     Args:
         chat_id: Опциональный ID чата для фильтрации
@@ -122,19 +437,22 @@ async def get_message_count(chat_id: Optional[int] = None) -> int:
     Returns:
         Количество сообщений
     """
+    if _total_count is not None:
+        return _per_chat_count.get(chat_id, 0) if chat_id else _total_count
+
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            if chat_id:
-                cursor = await db.execute(
-                    'SELECT COUNT(*) FROM messages WHERE chat_id = ?',
-                    (chat_id,)
-                )
-            else:
-                cursor = await db.execute('SELECT COUNT(*) FROM messages')
-            
-            result = await cursor.fetchone()
-            return result[0] if result else 0
-            
+        db = await get_read_db()
+        if chat_id:
+            cursor = await db.execute(
+                'SELECT COUNT(*) FROM messages WHERE chat_id = ?',
+                (chat_id,)
+            )
+        else:
+            cursor = await db.execute('SELECT COUNT(*) FROM messages')
+        
+        result = await cursor.fetchone()
+        return result[0] if result else 0
+        
     except Exception as e:
         logger.error(f"Ошибка при получении количества сообщений: {e}")
         return 0
@@ -5,33 +5,85 @@
 
 import asyncio
 import logging
-from datetime import datetime, timezone
+import logging.handlers
+import queue
+from collections import OrderedDict
+from operator import attrgetter
 from typing import List, Optional
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, utils
 from telethon.tl.types import User, Channel, Chat
 from telethon.errors import SessionPasswordNeededError, FloodWaitError
 
 from teleton.config import API_ID, API_HASH, SESSION_NAME
-from teleton.db import init_db, save_message, get_message_count
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('telegram_bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+from teleton.db import (
+    init_db,
+    close_db,
+    start_maintenance,
+    start_writer,
+    flush_writes,
+    stop_writer,
+    save_message,
+    save_messages_bulk,
+    read_batch,
+    get_message_count,
 )
+
 logger = logging.getLogger(__name__)
 
 # Игнорируемые отправители (не сохраняем их сообщения)
 IGNORED_SENDERS = {"ZeroBot0912", "BotFather"}
+# Те же имена в нижнем регистре: сравниваем без учета регистра
+_IGNORED_KEYS = frozenset(name.lower() for name in IGNORED_SENDERS)
+
+# Сбор истории: размер очереди между Telegram и БД и параметры пачек записи
+COLLECT_QUEUE_SIZE = 500
+COLLECT_BATCH_SIZE = 100
+COLLECT_FLUSH_INTERVAL = 0.25
+
+# Кэш названий чатов (LRU): chat_id -> название
+CHAT_TITLE_CACHE_SIZE = 1024
+_chat_titles: "OrderedDict[int, str]" = OrderedDict()
 
 # Глобальный клиент Telethon
 client: Optional[TelegramClient] = None
 
 
+# Слушатель очереди логов (создается один раз в configure_logging)
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """
+    Настройка логирования: в файл telegram_bot.log и в консоль.
+    Записи попадают в очередь, а на диск и в консоль их выводит фоновый поток,
+    поэтому логирование не блокирует цикл событий.
+    Повторный вызов не добавляет обработчики и возвращает уже созданный слушатель.
+    
+    Returns:
+        QueueListener: Запущенный слушатель (остановить через listener.stop())
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return _log_listener
+
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [
+        logging.FileHandler('telegram_bot.log', encoding='utf-8'),
+        logging.StreamHandler(),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _log_listener.start()
+    return _log_listener
+
+
 async def connect_client() -> TelegramClient:
     """
     Подключение к Telegram через Telethon.
@@ -101,9 +153,46 @@ async def get_dialogs(limit: int = 20) -> List:
         return []
 
 
+def _user_title(user: User) -> str:
+    """Имя пользователя для отображения."""
+    return f"{user.first_name} {user.last_name or ''}".strip()
+
+
+# Название сущности по ее точному типу: один поиск в словаре вместо цепочки isinstance
+_TITLE_FN = {
+    User: _user_title,
+    Channel: attrgetter('title'),
+    Chat: attrgetter('title'),
+}
+
+
+def _entity_title(entity, chat_id: int) -> str:
+    """Название чата по сущности Telethon."""
+    title_fn = _TITLE_FN.get(type(entity))
+    return title_fn(entity) if title_fn is not None else str(chat_id)
+
+
+def _cached_chat_title(chat_id: int) -> Optional[str]:
+    """Название чата из кэша (None, если его там нет)."""
+    title = _chat_titles.get(chat_id)
+    if title is not None:
+        _chat_titles.move_to_end(chat_id)
+    return title
+
+
+def _remember_chat_title(chat_id: int, title: str) -> str:
+    """Сохраняет название чата в кэш, вытесняя самые старые записи."""
+    _chat_titles[chat_id] = title
+    _chat_titles.move_to_end(chat_id)
+    if len(_chat_titles) > CHAT_TITLE_CACHE_SIZE:
+        _chat_titles.popitem(last=False)
+    return title
+
+
 async def get_chat_title(chat_id: int) -> str:
     """
     Получение названия чата по его ID.
+    Повторные запросы обслуживаются из кэша без обращения к Telegram.
     
     Args:
         chat_id: ID чата
@@ -111,21 +200,131 @@ async def get_chat_title(chat_id: int) -> str:
     Returns:
         Название чата
     """
+    title = _cached_chat_title(chat_id)
+    if title is not None:
+        return title
     try:
         entity = await client.get_entity(chat_id)
-        if isinstance(entity, (Channel, Chat)):
-            return entity.title
-        elif isinstance(entity, User):
-            return f"{entity.first_name} {entity.last_name or ''}".strip()
-        return str(chat_id)
+        return _remember_chat_title(chat_id, _entity_title(entity, chat_id))
     except Exception as e:
         logger.warning(f"Не удалось получить название чата {chat_id}: {e}")
         return str(chat_id)
 
 
+def _sender_key(sender) -> Optional[str]:
+    """
+    Ключ отправителя для проверки игнор-листа: username в нижнем регистре.
+    Дешевая проверка до построения отображаемого имени.
+    """
+    username = getattr(sender, 'username', None)
+    return username.lower() if username else None
+
+
+def _sender_name(sender, sender_id: Optional[int]) -> Optional[str]:
+    """Отображаемое имя отправителя (None, если отправитель неизвестен)."""
+    if not sender:
+        return None
+    title_fn = _TITLE_FN.get(type(sender))
+    if title_fn is not None:
+        return title_fn(sender)
+    return getattr(sender, 'title', None) or str(sender_id)
+
+
+def _build_row(message, chat_id: int, chat_title: str) -> Optional[tuple]:
+    """
+    Готовит строку для записи в БД из сообщения Telethon.
+    
+    Args:
+        message: Сообщение Telethon
+        chat_id: ID чата, под которым сохраняется сообщение
+        chat_title: Название чата (имя отправителя по умолчанию)
+    
+    Returns:
+        Кортеж (message_id, chat_id, sender, sender_id, text, date)
+        или None, если сообщение нужно пропустить
+    """
+    # Пропускаем нежелательных отправителей до любой другой работы
+    sender = message.sender
+    if _sender_key(sender) in _IGNORED_KEYS:
+        logger.debug("Пропущено сообщение от %s", sender.username)
+        return None
+    
+    # Если отправитель не определен (часто для каналов и групп),
+    # используем название чата/канала
+    sender_name = _sender_name(sender, message.sender_id) or chat_title
+    if sender_name.lower() in _IGNORED_KEYS:
+        logger.debug("Пропущено сообщение от %s", sender_name)
+        return None
+    
+    # Получение текста сообщения
+    text = message.message or "[медиа или без текста]"
+    
+    # Определяем sender_id: если отсутствует, используем ID чата (для каналов)
+    sender_id_value = message.sender_id if message.sender_id is not None else chat_id
+    
+    # Дата уходит в БД как есть: она хранится в миллисекундах Unix (UTC),
+    # перевод в локальное время не нужен (время без tzinfo считается UTC)
+    return (message.id, chat_id, sender_name, sender_id_value, text, message.date)
+
+
+async def _iter_into_queue(
+    chat_id: int, chat_title: str, limit: int, queue: asyncio.Queue
+) -> None:
+    """
+    Продюсер: получает сообщения из Telegram и кладет готовые строки в очередь.
+    По завершении кладет None — сигнал потребителю.
+    """
+    received = 0
+    offset_id = 0
+    try:
+        while received < limit:
+            try:
+                async for message in client.iter_messages(
+                    chat_id, limit=limit - received, offset_id=offset_id
+                ):
+                    received += 1
+                    offset_id = message.id
+                    try:
+                        row = _build_row(message, chat_id, chat_title)
+                        if row is None:
+                            continue
+                        # Передаем строку на запись, не дожидаясь сохранения
+                        await queue.put(row)
+                        logger.debug("Собрано сообщение %s: %.50s...", message.id, row[4])
+            
+                    except Exception as e:
+                        logger.error(f"Ошибка при обработке сообщения {message.id}: {e}")
+                        continue
+                break
+            except FloodWaitError as e:
+                # Telegram сам сообщает, сколько ждать: спим и продолжаем
+                # с последнего полученного сообщения
+                logger.warning(f"Rate limit! Ожидание {e.seconds} секунд...")
+                await asyncio.sleep(e.seconds)
+    finally:
+        await queue.put(None)
+
+
+async def _drain_and_insert(queue: asyncio.Queue) -> int:
+    """
+    Потребитель: забирает строки из очереди и сохраняет их пачками
+    через отдельное соединение, не мешая записи live-слушателя.
+    
+    Returns:
+        Количество новых сообщений
+    """
+    saved_count = 0
+    stopping = False
+    while not stopping:
+        rows, stopping = await read_batch(queue, COLLECT_BATCH_SIZE, COLLECT_FLUSH_INTERVAL)
+        saved_count += await save_messages_bulk(rows, bulk=True)
+    return saved_count
+
+
 async def collect_messages(chat_id: int, limit: int = 100) -> int:
     """
     Сбор последних N сообщений из выбранного чата.
+    Получение сообщений из сети и запись в БД идут параллельно через очередь.
     
     Args:
         chat_id: ID чата
@@ -140,65 +339,11 @@ async def collect_messages(chat_id: int, limit: int = 100) -> int:
         chat_title = await get_chat_title(chat_id)
         logger.info(f"Чат: {chat_title}")
         
-        collected_count = 0
-        
-        async for message in client.iter_messages(chat_id, limit=limit):
-            try:
-                # Получение информации об отправителе
-                sender_name = None
-                if message.sender:
-                    if isinstance(message.sender, User):
-                        sender_name = f"{message.sender.first_name} {message.sender.last_name or ''}".strip()
-                    else:
-                        sender_name = getattr(message.sender, 'title', None) or str(message.sender_id)
-                
-                # Если отправитель не определен (часто для каналов и групп),
-                # используем название чата/канала
-                if not sender_name:
-                    sender_name = chat_title
-
-                # Пропускаем нежелательных отправителей
-                if sender_name in IGNORED_SENDERS:
-                    logger.debug("Пропущено сообщение от %s", sender_name)
-                    continue
-                
-                # Получение текста сообщения
-                text = message.message or "[медиа или без текста]"
-                
-                # Определяем sender_id: если отсутствует, используем chat_id (для каналов)
-                sender_id_value = message.sender_id if message.sender_id is not None else chat_id
-                
-                # Конвертируем UTC время в локальное
-                if message.date.tzinfo is None:
-                    # Если tzinfo отсутствует, считаем время UTC и конвертируем в локальное
-                    local_date = message.date.replace(tzinfo=timezone.utc).astimezone()
-                else:
-                    # Если tzinfo есть, просто конвертируем в локальное
-                    local_date = message.date.astimezone()
-                
-                # Сохранение в базу данных
-                saved = await save_message(
-                    message_id=message.id,
-                    chat_id=chat_id,
-                    sender=sender_name,
-                    sender_id=sender_id_value,
-                    text=text,
-                    date=local_date
-                )
-                
-                if saved:
-                    collected_count += 1
-                    logger.debug(f"Собрано сообщение {message.id}: {text[:50]}...")
-                
-                # Небольшая задержка для избежания rate limit
-                await asyncio.sleep(0.1)
-                
-            except FloodWaitError as e:
-                logger.warning(f"Rate limit! Ожидание {e.seconds} секунд...")
-                await asyncio.sleep(e.seconds)
-            except Exception as e:
-                logger.error(f"Ошибка при обработке сообщения {message.id}: {e}")
-                continue
+        queue: asyncio.Queue = asyncio.Queue(maxsize=COLLECT_QUEUE_SIZE)
+        _, collected_count = await asyncio.gather(
+            _iter_into_queue(chat_id, chat_title, limit, queue),
+            _drain_and_insert(queue),
+        )
         
         logger.info(f"Собрано {collected_count} новых сообщений из чата {chat_title}")
         return collected_count
@@ -221,57 +366,30 @@ def register_event_handlers():
         """
         try:
             message = event.message
-            chat = await event.get_chat()
-            
-            # Получение названия чата
-            if isinstance(chat, (Channel, Chat)):
-                chat_title = chat.title
-            elif isinstance(chat, User):
-                chat_title = f"{chat.first_name} {chat.last_name or ''}".strip()
-            else:
-                chat_title = str(chat.id)
             
-            # Получение информации об отправителе
-            sender_name = None
-            if message.sender:
-                if isinstance(message.sender, User):
-                    sender_name = f"{message.sender.first_name} {message.sender.last_name or ''}".strip()
-                else:
-                    sender_name = getattr(message.sender, 'title', None) or str(message.sender_id)
-            
-            # Если отправитель не определен (часто для каналов и групп),
-            # используем название чата/канала
-            if not sender_name:
-                sender_name = chat_title
-
-            # Пропускаем нежелательных отправителей
-            if sender_name in IGNORED_SENDERS:
-                logger.debug("Пропущено сообщение от %s", sender_name)
+            # Пропускаем нежелательных отправителей до запроса чата
+            sender = message.sender
+            if _sender_key(sender) in _IGNORED_KEYS:
+                logger.debug("Пропущено сообщение от %s", sender.username)
                 return
             
-            # Получение текста сообщения
-            text = message.message or "[медиа или без текста]"
+            # Получение названия чата: при попадании в кэш чат не запрашиваем
+            chat_id = event.chat_id
+            chat_title = _cached_chat_title(chat_id)
+            if chat_title is None:
+                chat = await event.get_chat()
+                chat_title = _remember_chat_title(chat_id, _entity_title(chat, chat_id))
             
-            # Определяем sender_id: если отсутствует, используем chat.id (для каналов)
-            sender_id_value = message.sender_id if message.sender_id is not None else chat.id
+            # В БД пишем ID сущности без префикса -100, как и раньше (chat.id)
+            entity_id, _ = utils.resolve_id(chat_id)
             
-            # Конвертируем UTC время в локальное
-            if message.date.tzinfo is None:
-                # Если tzinfo отсутствует, считаем время UTC и конвертируем в локальное
-                local_date = message.date.replace(tzinfo=timezone.utc).astimezone()
-            else:
-                # Если tzinfo есть, просто конвертируем в локальное
-                local_date = message.date.astimezone()
+            row = _build_row(message, entity_id, chat_title)
+            if row is None:
+                return
             
             # Сохранение в базу данных
-            await save_message(
-                message_id=message.id,
-                chat_id=chat.id,
-                sender=sender_name,
-                sender_id=sender_id_value,
-                text=text,
-                date=local_date
-            )
+            await save_message(*row)
+            sender_name, text = row[2], row[4]
             
             # Вывод короткого лога в консоль
             print(f"[{chat_title}] {sender_name}: {text[:100]}")
@@ -297,9 +415,12 @@ async def main():
     """
     Основная функция с примером использования.
     """
+    listener = configure_logging()
     try:
         # Инициализация базы данных
         await init_db()
+        await start_writer()
+        start_maintenance()
         logger.info("База данных готова")
         
         # Подключение к Telegram
@@ -326,6 +447,9 @@ async def main():
             
             await collect_messages(first_chat_id, limit=100)
             
+            # Дописываем собранное перед подсчетом статистики
+            await flush_writes()
+            
             # Показать статистику
             total_messages = await get_message_count()
             chat_messages = await get_message_count(first_chat_id)
@@ -345,9 +469,16 @@ async def main():
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}", exc_info=True)
     finally:
-        if client:
-            await client.disconnect()
-            logger.info("Клиент отключен")
+        try:
+            if client:
+                await client.disconnect()
+                logger.info("Клиент отключен")
+        finally:
+            # Дописываем накопленную пачку live-сообщений, в том числе при Ctrl-C
+            await stop_writer()
+            await close_db()
+            # Выводим оставшиеся в очереди записи лога
+            listener.stop()
 
 
 if __name__ == '__main__':
@@ -1,11 +1,36 @@
 """
 Тестовый скрипт для проверки работы GigaChat API и получения access token.
 """
+import os
+
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Путь к сертификату НУЦ Минцифры (корневой CA Сбера). Если не задан,
+# проверка SSL отключается, как и раньше
+CA_BUNDLE = os.getenv("GIGACHAT_CA_BUNDLE")
+
+if not CA_BUNDLE:
+    # Отключаем предупреждения о небезопасных SSL сертификатах
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# Отключаем предупреждения о небезопасных SSL сертификатах
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# Одна сессия на все запросы: TLS-соединение переиспользуется,
+# временные ошибки сервера повторяются с backoff
+_session = requests.Session()
+_session.verify = CA_BUNDLE or False
+_session.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=None,  # POST за токеном тоже повторяем
+        raise_on_status=False,  # после повторов отдаем последний ответ как есть
+    ),
+))
 
 url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
 
@@ -23,12 +48,10 @@ headers = {
 print("Отправка запроса...\n")
 
 try:
-    # Добавляем verify=False для обхода SSL ошибки
-    response = requests.post(
+    response = _session.post(
         url, 
         headers=headers, 
         data=payload,
-        verify=False,  # Отключаем проверку SSL сертификата
         timeout=30
     )
     